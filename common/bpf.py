@@ -0,0 +1,79 @@
+import ctypes
+import ctypes.util
+import subprocess
+
+# cBPF 'ip or ip6' (tcpdump -dd "ip or ip6")，编译不可用时的保底程序
+DEFAULT_PROG = (
+    (0x28, 0, 0, 0x0000000c),
+    (0x15, 1, 0, 0x00000800),
+    (0x15, 0, 1, 0x000086dd),
+    (0x06, 0, 0, 0x00040000),
+    (0x06, 0, 0, 0x00000000),
+)
+
+DLT_EN10MB = 1
+
+class _bpf_insn(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_ushort),
+                ('jt', ctypes.c_ubyte),
+                ('jf', ctypes.c_ubyte),
+                ('k', ctypes.c_uint)]
+
+class _bpf_program(ctypes.Structure):
+    _fields_ = [('bf_len', ctypes.c_uint),
+                ('bf_insns', ctypes.POINTER(_bpf_insn))]
+
+def _compile_libpcap(expr: str):
+    """通过 libpcap 的 pcap_compile 把过滤表达式编成 cBPF"""
+    libname = ctypes.util.find_library('pcap')
+    if not libname:
+        return None
+    pcap = ctypes.CDLL(libname)
+    pcap.pcap_open_dead.restype = ctypes.c_void_p
+    handle = pcap.pcap_open_dead(DLT_EN10MB, 65535)
+    if not handle:
+        return None
+    prog = _bpf_program()
+    try:
+        if pcap.pcap_compile(ctypes.c_void_p(handle), ctypes.byref(prog),
+                             expr.encode(), 1, 0xffffffff) != 0:
+            return None
+        insns = tuple((prog.bf_insns[i].code, prog.bf_insns[i].jt,
+                       prog.bf_insns[i].jf, prog.bf_insns[i].k)
+                      for i in range(prog.bf_len))
+        pcap.pcap_freecode(ctypes.byref(prog))
+        return insns
+    finally:
+        pcap.pcap_close(ctypes.c_void_p(handle))
+
+def _compile_tcpdump(expr: str):
+    """libpcap 不可用时退而求其次，借 tcpdump -ddd 编译"""
+    try:
+        out = subprocess.run(['tcpdump', '-y', 'EN10MB', '-ddd', expr],
+                             capture_output=True, timeout=10, check=True)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    lines = out.stdout.decode().split()
+    n = int(lines[0])
+    vals = [int(v) for v in lines[1:1 + n * 4]]
+    return tuple((vals[i], vals[i + 1], vals[i + 2], vals[i + 3])
+                 for i in range(0, n * 4, 4))
+
+def compile_filter(expr: str):
+    """编译 pcap 过滤表达式为 cBPF 指令元组，失败返回 None"""
+    prog = _compile_libpcap(expr)
+    if prog is None:
+        prog = _compile_tcpdump(expr)
+    return prog
+
+def rule_filter_expr(rules) -> str:
+    """把活动规则的 src/dst 网段并集拼成一条过滤表达式
+
+    内核侧先按 `tcp and (src nets) and (dst nets)` 粗筛，
+    不命中任何规则网段的包根本进不了抓包环。
+    """
+    src_nets = sorted({r.src for r in rules})
+    dst_nets = sorted({r.dst for r in rules})
+    src_expr = ' or '.join(f'src net {n}' for n in src_nets)
+    dst_expr = ' or '.join(f'dst net {n}' for n in dst_nets)
+    return f'tcp and (({src_expr}) and ({dst_expr}))'
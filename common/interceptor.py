@@ -1,8 +1,303 @@
+import ctypes
+import fcntl
 import ipaddress
+import queue
+import socket
+import struct
 import threading
-from scapy.all import *
-from scapy.layers.inet import IP, TCP
-from scapy.layers.l2 import Ether
+import time
+
+from common import logger
+
+log = logger.get_logger('interceptor.sender')
+
+SIOCGIFHWADDR = 0x8927
+
+# sendmmsg(2) 绑定：一批 RST 一次系统调用发完
+class _iovec(ctypes.Structure):
+    _fields_ = [('iov_base', ctypes.c_void_p),
+                ('iov_len', ctypes.c_size_t)]
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [('msg_name', ctypes.c_void_p),
+                ('msg_namelen', ctypes.c_uint),
+                ('msg_iov', ctypes.POINTER(_iovec)),
+                ('msg_iovlen', ctypes.c_size_t),
+                ('msg_control', ctypes.c_void_p),
+                ('msg_controllen', ctypes.c_size_t),
+                ('msg_flags', ctypes.c_int)]
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [('msg_hdr', _msghdr),
+                ('msg_len', ctypes.c_uint)]
+
+try:
+    _libc = ctypes.CDLL(None, use_errno=True)
+    _sendmmsg = _libc.sendmmsg
+    _sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr),
+                          ctypes.c_uint, ctypes.c_int]
+    _sendmmsg.restype = ctypes.c_int
+except (OSError, AttributeError):
+    _sendmmsg = None
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+# 可选 io_uring TX 环（与抓包侧的 RX 环分开，避免相互争用），
+# 仅发送线程使用，批量提交 send SQE，一次 submit 发整批
+_TX_DEPTH = 64
+_tx_ring = None
+
+def _get_tx_ring():
+    global _tx_ring
+    if _tx_ring is None and liburing is not None:
+        ring = liburing.io_uring()
+        flags = (getattr(liburing, 'IORING_SETUP_SINGLE_ISSUER', 0) |
+                 getattr(liburing, 'IORING_SETUP_DEFER_TASKRUN', 0))
+        try:
+            liburing.io_uring_queue_init(_TX_DEPTH, ring, flags)
+        except OSError:
+            try:
+                liburing.io_uring_queue_init(_TX_DEPTH, ring, 0)
+            except OSError:
+                return None
+        _tx_ring = ring
+    return _tx_ring
+
+def _checksum(data: bytes) -> int:
+    """RFC1071 16位反码和校验"""
+    if len(data) % 2:
+        data += b'\x00'
+    s = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    while s >> 16:
+        s = (s & 0xffff) + (s >> 16)
+    return (~s) & 0xffff
+
+def _make_rst_template() -> bytes:
+    """预生成 54 字节 Ether+IPv4+TCP RST 帧模板
+
+    除 MAC/IP 地址、端口、seq/ack 和两处校验和外所有字段固定，
+    发送时只 pack_into 变化字段，热路径上完全不碰 scapy。
+    """
+    buf = bytearray(54)
+    # Ether: dst/src 置零等待填充, type=0x0800
+    struct.pack_into('!H', buf, 12, 0x0800)
+    # IP: ver/ihl=0x45, len=40, ttl=64, proto=6
+    struct.pack_into('!BBHHHBBH', buf, 14, 0x45, 0, 40, 0, 0, 64, 6, 0)
+    # TCP: offset=5, flags=RST(0x04), window=8192
+    struct.pack_into('!HHIIBBH', buf, 34, 0, 0, 0, 0, 0x50, 0x04, 8192)
+    return bytes(buf)
+
+def _make_rst6_template() -> bytes:
+    """预生成 74 字节 Ether+IPv6+TCP RST 帧模板
+
+    IPv6 头定长 40 字节且没有头校验和，只有 TCP 校验和要补。
+    """
+    buf = bytearray(74)
+    # Ether: type=0x86dd
+    struct.pack_into('!H', buf, 12, 0x86dd)
+    # IPv6: ver=6, payload len=20, next header=6(TCP), hop limit=64
+    struct.pack_into('!IHBB', buf, 14, 0x60000000, 20, 6, 64)
+    # TCP: offset=5, flags=RST(0x04), window=8192
+    struct.pack_into('!HHIIBBH', buf, 54, 0, 0, 0, 0, 0x50, 0x04, 8192)
+    return bytes(buf)
+
+_RST_TEMPLATE = _make_rst_template()
+_RST6_TEMPLATE = _make_rst6_template()
+
+# 发送侧共享状态：socket/MAC 按 iface 缓存，发送队列 + 常驻工作线程。
+# 每次拦截事件新起一个线程（~100µs）在突发时会拖垮 radar 线程，
+# 改为 radar 只入队元组，由单个 daemon 线程负责构帧和发送。
+_socket_cache = {}
+_socket_lock = threading.Lock()
+_iface_mac_cache = {}
+_send_queue = queue.SimpleQueue()
+_sender_thread = None
+
+def _get_socket(iface):
+    """获取或创建发送 socket，按 iface 缓存"""
+    with _socket_lock:
+        if iface not in _socket_cache:
+            try:
+                sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                                     socket.ntohs(0x0003))
+                sock.bind((iface, 0))
+                sock.setblocking(False)  # 设置非阻塞
+                _socket_cache[iface] = sock
+            except Exception as e:
+                log.error("Failed to create socket: %s", e)
+                return None
+        return _socket_cache[iface]
+
+def _get_iface_mac(iface) -> bytes:
+    """取出口网卡 MAC 作为源 MAC，按 iface 缓存"""
+    mac = _iface_mac_cache.get(iface)
+    if mac is None:
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                info = fcntl.ioctl(s.fileno(), SIOCGIFHWADDR,
+                                   struct.pack('256s', iface.encode()[:15]))
+            mac = info[18:24]
+        except OSError:
+            mac = b'\x00' * 6
+        _iface_mac_cache[iface] = mac
+    return mac
+
+def _build_rst(src_ip: bytes, dst_ip: bytes, sport: int, dport: int,
+               seq: int, ack: int, dst_mac: str, iface: str) -> bytes:
+    """在按地址族选出的模板上只改写变化字段并补校验和"""
+    if len(src_ip) == 4:
+        buf = bytearray(_RST_TEMPLATE)
+        ip_off, tcp_off = 26, 34
+    else:
+        buf = bytearray(_RST6_TEMPLATE)
+        ip_off, tcp_off = 22, 54
+    if dst_mac:
+        buf[0:6] = bytes.fromhex(dst_mac.replace(':', ''))
+    buf[6:12] = _get_iface_mac(iface)
+    n = len(src_ip)
+    buf[ip_off:ip_off + n] = src_ip
+    buf[ip_off + n:ip_off + 2 * n] = dst_ip
+    struct.pack_into('!HHII', buf, tcp_off, sport, dport,
+                     seq & 0xffffffff, ack & 0xffffffff)
+    if n == 4:
+        # IP 头校验和
+        struct.pack_into('!H', buf, 24, _checksum(bytes(buf[14:34])))
+        # TCP 校验和：伪首部(src/dst/0/proto/len) + TCP 头
+        pseudo = bytes(buf[26:34]) + b'\x00\x06\x00\x14'
+    else:
+        # IPv6 无头校验和；伪首部为 src/dst/len(4B)/zero(3B)/next header
+        pseudo = bytes(buf[22:54]) + b'\x00\x00\x00\x14\x00\x00\x00\x06'
+    struct.pack_into('!H', buf, tcp_off + 16,
+                     _checksum(pseudo + bytes(buf[tcp_off:tcp_off + 20])))
+    return bytes(buf)
+
+def _send_frame(sock, frame: bytes):
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            sock.send(frame)
+            break
+        except BlockingIOError:
+            if attempt < max_retries - 1:
+                time.sleep(0.001)
+            else:
+                log.warning("Failed to send after %d retries", max_retries)
+        except Exception as e:
+            log.error("Send error: %s", e)
+            break
+
+def _send_frames_uring(sock, frames) -> bool:
+    """整批帧挂成 send SQE 一次 submit，成功返回 True"""
+    ring = _get_tx_ring()
+    if ring is None:
+        return False
+    fd = sock.fileno()
+    n = 0
+    for frame in frames:
+        sqe = liburing.io_uring_get_sqe(ring)
+        if sqe is None:
+            break  # 环满，剩余帧走回退路径
+        liburing.io_uring_prep_send(sqe, fd, frame, len(frame), 0)
+        n += 1
+    if n == 0:
+        return False
+    liburing.io_uring_submit_and_wait(ring, n)
+    cqe = liburing.io_uring_cqe()
+    for _ in range(n):
+        try:
+            liburing.io_uring_peek_cqe(ring, cqe)
+        except (OSError, BlockingIOError):
+            break
+        liburing.io_uring_cqe_seen(ring, cqe)
+    if n < len(frames):
+        for frame in frames[n:]:
+            _send_frame(sock, frame)
+    return True
+
+def _send_frames(sock, frames):
+    """一批帧尽量一次 sendmmsg 发出，不可用时退回逐帧 send"""
+    if liburing is not None and _send_frames_uring(sock, frames):
+        return
+    if _sendmmsg is None or len(frames) == 1:
+        for frame in frames:
+            _send_frame(sock, frame)
+        return
+    n = len(frames)
+    iovs = (_iovec * n)()
+    msgs = (_mmsghdr * n)()
+    bufs = [ctypes.create_string_buffer(f, len(f)) for f in frames]
+    for i, f in enumerate(frames):
+        iovs[i].iov_base = ctypes.cast(bufs[i], ctypes.c_void_p)
+        iovs[i].iov_len = len(f)
+        msgs[i].msg_hdr.msg_iov = ctypes.pointer(iovs[i])
+        msgs[i].msg_hdr.msg_iovlen = 1
+    sent = _sendmmsg(sock.fileno(), msgs, n, 0)
+    if sent < 0:
+        # 内核拒绝整批（如 EAGAIN）时退回逐帧重试路径
+        for frame in frames:
+            _send_frame(sock, frame)
+    elif sent < n:
+        for frame in frames[sent:]:
+            _send_frame(sock, frame)
+
+def _rst_pair(item):
+    src_ip, dst_ip, sport, dport, seq, ack, dst_mac, iface = item
+    # 客户端方向的 RST 报文（从 src 到 dst）
+    client_rst = _build_rst(src_ip, dst_ip, sport, dport,
+                            seq, ack, dst_mac, iface)
+    # 服务器方向的 RST 报文（从 dst 到 src）
+    # 使用对端的 ack 作为 seq，RST 对应于下一个序列号
+    server_rst = _build_rst(dst_ip, src_ip, dport, sport,
+                            ack, seq + 1, dst_mac, iface)
+    return client_rst, server_rst
+
+def _send_rst(item):
+    sock = _get_socket(item[7])
+    if not sock:
+        return
+    _send_frames(sock, list(_rst_pair(item)))
+
+def enqueue_rst(src_ip: bytes, dst_ip: bytes, sport: int, dport: int,
+                seq: int, ack: int, dst_mac: str, iface: str):
+    """radar 热路径入口：只入队，不构帧不发包"""
+    _send_queue.put((src_ip, dst_ip, sport, dport, seq, ack, dst_mac, iface))
+
+def _sender_loop():
+    while True:
+        items = [_send_queue.get()]
+        # 突发时把积压的事件一起取出，按 iface 归组后整批 sendmmsg
+        for _ in range(31):
+            try:
+                items.append(_send_queue.get_nowait())
+            except queue.Empty:
+                break
+        # 构帧/发送出错（如配置里的 dst_mac 不合法）只记日志丢弃本批，
+        # 发送线程是全局单例，绝不能让异常把它杀掉
+        try:
+            by_iface = {}
+            for item in items:
+                by_iface.setdefault(item[7], []).extend(_rst_pair(item))
+            for iface, frames in by_iface.items():
+                sock = _get_socket(iface)
+                if sock:
+                    _send_frames(sock, frames)
+        except Exception as e:
+            log.error("Error in sender loop: %s", e)
+
+def init_tx_socket(iface):
+    """daemon 启动时预开发送 socket，首次拦截不再付建socket的开销"""
+    return _get_socket(iface)
+
+def start_sender():
+    """启动常驻发送线程，幂等，在 daemon 启动时调用一次"""
+    global _sender_thread
+    if _sender_thread is None or not _sender_thread.is_alive():
+        _sender_thread = threading.Thread(target=_sender_loop, daemon=True)
+        _sender_thread.start()
+        log.info('RST sender started')
 
 class Interceptor:
     src_addr: ipaddress.ip_address
@@ -14,8 +309,8 @@ class Interceptor:
     proto: str
 
 class TCPInterceptor(Interceptor):
-    _socket_cache = {}  # 类级别的 socket 缓存
-    _socket_lock = threading.Lock()
+    """同步拦截接口，直接复用模板和缓存 socket"""
+
     def __init__(self, kwargs):
         super().__init__()
         self.src_addr = ipaddress.ip_address(kwargs['src_addr'])
@@ -27,68 +322,8 @@ class TCPInterceptor(Interceptor):
         self.dst_mac = kwargs.get('dst_mac', None)
         self.iface = kwargs.get('iface', None)
         self.proto = 'tcp'
-        self.intercept_thread = None
-
-    def _get_socket(self):
-        """获取或创建 socket"""
-        with self._socket_lock:
-            if self.iface not in self._socket_cache:
-                try:
-                    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 
-                                       socket.ntohs(0x0003))
-                    sock.bind((self.iface, 0))
-                    sock.setblocking(False)  # 设置非阻塞
-                    self._socket_cache[self.iface] = sock
-                except Exception as e:
-                    print(f"Failed to create socket: {e}")
-                    return None
-            return self._socket_cache[self.iface]
 
     def intercept(self):
-        # 创建 raw socket
-        raw_socket = self._get_socket()
-        if not raw_socket:
-            return
-
-        # 构造客户端方向的 RST 报文（从 src 到 dst）
-        client_rst_pkt = Ether() / IP(src=str(self.src_addr), dst=str(self.dst_addr)) / TCP(
-            sport=self.src_port,
-            dport=self.dst_port,
-            flags="R",  # RST 标志
-            seq=self.seq,
-            ack=self.ack
-        )
-
-        # 构造服务器方向的 RST 报文（从 dst 到 src）
-        server_rst_pkt = Ether() / IP(src=str(self.dst_addr), dst=str(self.src_addr)) / TCP(
-            sport=self.dst_port,
-            dport=self.src_port,
-            flags="R",  # RST 标志
-            seq=self.ack,  # 使用对端的 ack 作为 seq
-            ack=self.seq + 1  # 假设 RST 是对应于下一个序列号
-        )
-
-        # 如果提供了目标 MAC 地址，则设置 Ethernet 层
-        if self.dst_mac:
-            client_rst_pkt[Ether].dst = self.dst_mac
-            server_rst_pkt[Ether].dst = self.dst_mac
-
-        for pkt in [client_rst_pkt, server_rst_pkt]:
-            max_retries = 3
-            for attempt in range(max_retries):
-                try:
-                    raw_socket.send(bytes(pkt))
-                    break
-                except BlockingIOError:
-                    if attempt < max_retries - 1:
-                        time.sleep(0.001)
-                    else:
-                        print(f"Failed to send after {max_retries} retries")
-                except Exception as e:
-                    print(f"Send error: {e}")
-                    break
-
-    def run(self):
-        self.intercept_thread = threading.Thread(target=self.intercept,daemon=True)
-        self.intercept_thread.start()
-        print('Interception engaged')
\ No newline at end of file
+        _send_rst((self.src_addr.packed, self.dst_addr.packed,
+                   self.src_port, self.dst_port, self.seq, self.ack,
+                   self.dst_mac, self.iface))
@@ -1,8 +1,30 @@
 import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 按 (path, mtime_ns) 记忆化：进程内重复加载（如 reload 信号）不重新解析
+_cache = {}
 
 def load(path:str):
     try:
-        with open(path,'r',encoding='utf-8') as fp:
-            return json.load(fp)
+        key = (path, os.stat(path).st_mtime_ns)
+    except FileNotFoundError as e:
+        return str(e)
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        with open(path,'rb') as fp:
+            raw = fp.read()
     except FileNotFoundError as e:
-        return str(e)
\ No newline at end of file
+        return str(e)
+    data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+    # 同一路径旧 mtime 的条目顺带清掉
+    for old_key in [k for k in _cache if k[0] == path]:
+        del _cache[old_key]
+    _cache[key] = data
+    return data
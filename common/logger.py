@@ -0,0 +1,27 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+_listener = None
+
+def get_logger(name:str='interceptor'):
+    """返回经队列解耦的 logger
+
+    热路径上的 log 调用只把记录塞进内存队列（%-参数在 handler
+    真正处理前不会格式化），stdout 锁和写 syscall 都由后台
+    QueueListener 线程承担，不再串行化 radar/发送线程。
+    """
+    global _listener
+    if _listener is None:
+        log_queue = queue.SimpleQueue()
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(name)s %(levelname)s %(message)s'))
+        _listener = logging.handlers.QueueListener(log_queue, handler)
+        _listener.start()
+        atexit.register(_listener.stop)
+        root = logging.getLogger('interceptor')
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        root.setLevel(logging.INFO)
+    return logging.getLogger(name)
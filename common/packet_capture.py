@@ -1,28 +1,233 @@
-from scapy.all import sniff
+from common import bpf
+from common import logger
 from common import ringbuffer
+import ctypes
+import mmap
+import select
+import socket
+import struct
 import threading
 
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+try:
+    import pcap  # pypcap: libpcap 的 cython 绑定
+except ImportError:
+    pcap = None
+
+log = logger.get_logger('interceptor.capture')
+
+# AF_PACKET / TPACKET_V3 常量 (linux/if_packet.h)
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_VERSION = 10
+PACKET_RX_RING = 5
+TPACKET_V3 = 2
+TP_STATUS_USER = 1
+TP_STATUS_KERNEL = 0
+SO_ATTACH_FILTER = 26
+
+# 环形缓冲区布局: block_size * block_nr 字节 mmap 到用户态
+BLOCK_SIZE = 1 << 22
+BLOCK_NR = 64
+FRAME_SIZE = 2048
+
+# io_uring RX 环深度（backend='io_uring' 时使用）
+URING_DEPTH = 256
+
 class PacketCapture:
-    pkt_buffer = ringbuffer.RingBuffer(1024)
+    # 4096 槽 ≈ 单个 radar 批次（128）的 32 倍余量，短暂停顿不丢包
+    pkt_buffer = ringbuffer.RingBuffer(4096)
 
     def __init__(self,kwargs):
         self.sniff_if = kwargs['sniff_if']
+        # 'tpacket_v3'（默认）、'io_uring'（需要 Linux>=5.1 和 liburing）
+        # 或 'pcap'（libpcap 路径，非 Linux 或 mmap 不可用时的退路）
+        self.backend = kwargs.get('backend', 'tpacket_v3')
+        if self.backend == 'io_uring' and liburing is None:
+            log.warning('liburing unavailable, falling back to tpacket_v3')
+            self.backend = 'tpacket_v3'
+        if self.backend == 'pcap' and pcap is None:
+            log.warning('pypcap unavailable, falling back to tpacket_v3')
+            self.backend = 'tpacket_v3'
+        # 内核侧过滤：规则并集编成 cBPF，编不出来就保底 'ip or ip6'
+        self.bpf_prog = bpf.DEFAULT_PROG
+        self.filter_expr = kwargs.get('filter')
+        filter_expr = self.filter_expr
+        if filter_expr:
+            prog = bpf.compile_filter(filter_expr)
+            if prog:
+                self.bpf_prog = prog
+            else:
+                log.warning('BPF compile failed for "%s", '
+                            'using default ip-or-ip6 filter', filter_expr)
         self.capture_thread = None
         self.stop_flag = False
+        self.sock = None
+        self.ring = None
 
     def packet_callback(self,packet):
         self.pkt_buffer.write(packet)
 
+    def _attach_filter(self, sock, prog):
+        # sock_fprog: { u16 len; struct sock_filter *filter; }
+        insns = b''.join(struct.pack('HBBI', code, jt, jf, k)
+                         for code, jt, jf, k in prog)
+        buf = ctypes.create_string_buffer(insns)
+        fprog = struct.pack('HL', len(prog), ctypes.addressof(buf))
+        sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    def _open_ring(self):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                             socket.htons(ETH_P_ALL))
+        self._attach_filter(sock, self.bpf_prog)
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        # tpacket_req3: block_size/block_nr/frame_size/frame_nr/retire_tov/priv/feature
+        frame_nr = (BLOCK_SIZE // FRAME_SIZE) * BLOCK_NR
+        req = struct.pack('IIIIIII', BLOCK_SIZE, BLOCK_NR, FRAME_SIZE,
+                          frame_nr, 60, 0, 0)
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+        ring = mmap.mmap(sock.fileno(), BLOCK_SIZE * BLOCK_NR,
+                         mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        sock.bind((self.sniff_if, 0))
+        return sock, ring
+
+    def _walk_block(self, base):
+        # tpacket_block_desc -> tpacket_hdr_v1: num_pkts / offset_to_first_pkt
+        num_pkts, first_off = struct.unpack_from('=II', self.ring, base + 12)
+        pos = base + first_off
+        for _ in range(num_pkts):
+            # tpacket3_hdr: tp_next_offset / tp_snaplen / tp_mac
+            next_off, snaplen, mac = struct.unpack_from('=I8xI8xH',
+                                                        self.ring, pos)
+            start = pos + mac
+            # 块归还内核前必须拷出，memoryview 会悬空
+            self.packet_callback(bytes(self.ring[start:start + snaplen]))
+            if next_off == 0:
+                break
+            pos += next_off
+
+    def _run_sniff_uring(self):
+        """io_uring RX 后端：批量 recv SQE 常驻环内，完成即重投
+
+        专用 RX 环（TX 在 interceptor 侧有自己的环），SINGLE_ISSUER +
+        DEFER_TASKRUN 只允许本线程提交，内核侧开销最低。
+        """
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW,
+                             socket.htons(ETH_P_ALL))
+        self._attach_filter(sock, self.bpf_prog)
+        sock.bind((self.sniff_if, 0))
+        self.sock = sock
+        fd = sock.fileno()
+
+        flags = 0
+        for name in ('IORING_SETUP_SINGLE_ISSUER',
+                     'IORING_SETUP_DEFER_TASKRUN'):
+            flags |= getattr(liburing, name, 0)
+        ring = liburing.io_uring()
+        try:
+            liburing.io_uring_queue_init(URING_DEPTH, ring, flags)
+        except OSError:
+            # 老内核不认识新 setup flag，退回默认
+            liburing.io_uring_queue_init(URING_DEPTH, ring, 0)
+
+        bufs = [bytearray(FRAME_SIZE) for _ in range(URING_DEPTH)]
+        iovs = [liburing.iovec(b) for b in bufs]
+
+        def submit_recv(i):
+            sqe = liburing.io_uring_get_sqe(ring)
+            liburing.io_uring_prep_recv(sqe, fd, iovs[i].iov_base,
+                                        FRAME_SIZE, 0)
+            sqe.user_data = i
+
+        try:
+            for i in range(URING_DEPTH):
+                submit_recv(i)
+            liburing.io_uring_submit(ring)
+            cqe = liburing.io_uring_cqe()
+            # 带超时等待，保证 stop_flag 能被及时看到
+            wait_ts = liburing.timespec(0, 100_000_000)
+            while not self.stop_flag:
+                try:
+                    liburing.io_uring_wait_cqe_timeout(ring, cqe, wait_ts)
+                except (OSError, BlockingIOError):
+                    continue  # 超时，无完成事件
+                done = 0
+                while True:
+                    i = cqe.user_data
+                    res = cqe.res
+                    if res > 0:
+                        self.packet_callback(bytes(bufs[i][:res]))
+                    liburing.io_uring_cqe_seen(ring, cqe)
+                    submit_recv(i)
+                    done += 1
+                    try:
+                        if liburing.io_uring_peek_cqe(ring, cqe) != 0:
+                            break
+                    except (OSError, BlockingIOError):
+                        break
+                if done:
+                    liburing.io_uring_submit(ring)
+        finally:
+            liburing.io_uring_queue_exit(ring)
+            sock.close()
+
+    def _run_sniff_pcap(self):
+        """libpcap 后端：pypcap 直取原始帧，整条路径无 scapy
+
+        immediate 模式 + 1ms 超时，libpcap 不攒包；dispatch 按批
+        回调，每批之间检查 stop_flag。过滤表达式交给 libpcap 自己
+        编译下发，与 tpacket 路径的 cBPF 等价。
+        """
+        pc = pcap.pcap(name=self.sniff_if, promisc=True,
+                       immediate=True, timeout_ms=1)
+        if self.filter_expr:
+            try:
+                pc.setfilter(self.filter_expr)
+            except OSError:
+                log.warning('pcap setfilter failed for "%s"',
+                            self.filter_expr)
+        cb = self.packet_callback
+        while not self.stop_flag:
+            # 回调拿到的 buf 是 libpcap 内部缓冲的视图，必须拷出
+            pc.dispatch(64, lambda ts, buf: cb(bytes(buf)))
+
     def run_sniff(self):
-        sniff(filter='ip or ip6', iface=self.sniff_if, prn=self.packet_callback, store=0, stop_filter=lambda x: self.stop_flag)
+        if self.backend == 'io_uring':
+            self._run_sniff_uring()
+            return
+        if self.backend == 'pcap':
+            self._run_sniff_pcap()
+            return
+        self.sock, self.ring = self._open_ring()
+        poller = select.poll()
+        poller.register(self.sock.fileno(), select.POLLIN)
+        block_idx = 0
+        try:
+            while not self.stop_flag:
+                base = block_idx * BLOCK_SIZE
+                status, = struct.unpack_from('=I', self.ring, base + 8)
+                if not status & TP_STATUS_USER:
+                    poller.poll(100)
+                    continue
+                self._walk_block(base)
+                # 归还块给内核
+                struct.pack_into('=I', self.ring, base + 8, TP_STATUS_KERNEL)
+                block_idx = (block_idx + 1) % BLOCK_NR
+        finally:
+            self.ring.close()
+            self.sock.close()
 
     def run(self):
         self.stop_flag = False
         self.capture_thread = threading.Thread(target=self.run_sniff, daemon=True)
         self.capture_thread.start()
-        print('Capture started')
+        log.info('Capture started')
 
     def stop(self):
         self.stop_flag = True
         self.capture_thread.join(5)
-        print('Capture stopped')
\ No newline at end of file
+        log.info('Capture stopped')
@@ -1,135 +1,178 @@
+from collections import OrderedDict
 from common import ringbuffer
-from scapy.all import TCP, IP, IPv6
+import functools
 import ipaddress
+import struct
 import threading
 from common import interceptor
+from common import logger
 import time
 
-class TCPRadar:
+log = logger.get_logger('interceptor.radar')
+
+@functools.lru_cache(maxsize=1024)
+def _addr_str(addr_bytes: bytes) -> str:
+    """packed 地址 -> 点分字符串，按地址记忆化
+
+    同一连接/主机反复触发时不重建 ipaddress 对象；
+    拦截路径本身全程用 packed 字节，这里只服务于日志。
+    """
+    return str(ipaddress.ip_address(addr_bytes))
+
+def _parse_py(buf):
+    """逐包解析：预过滤 + 头部字段提取
+
+    纯数值循环，与 common/_radar_fast.pyx 的 Cython 实现签名一致，
+    编译产物存在时优先加载。返回
+    (family, src_bytes, dst_bytes, src_int, dst_int, sport, dport, ip_end)，
+    非 TCP 或头部不完整返回 None。
+    """
+    if len(buf) < 34:
+        return None
+
+    # 廉价预过滤：先看 EtherType 和 IP 协议号，绝大多数
+    # 不匹配的包在这里就被丢掉，不构造任何 scapy 对象
+    ethertype, = struct.unpack_from('!12xH', buf, 0)
+    if ethertype == 0x0800:
+        # IPv4 头一次解出 ihl/proto/src/dst
+        ver_ihl, _, _, _, _, _, proto, _, src_bytes, dst_bytes = \
+            struct.unpack_from('!BBHHHBBH4s4s', buf, 14)
+        if proto != 6:
+            return None
+        family = 4
+        ip_end = 14 + (ver_ihl & 0x0f) * 4
+    elif ethertype == 0x86dd:
+        if len(buf) < 54 or buf[20] != 6:
+            return None  # 只看 next header 直接是 TCP 的情况
+        family = 6
+        src_bytes = buf[22:38]
+        dst_bytes = buf[38:54]
+        ip_end = 14 + 40
+    else:
+        return None
+
+    # 调用方还要读 seq/ack/flags，确保 TCP 头完整
+    if len(buf) < ip_end + 14:
+        return None
+
+    src_int = int.from_bytes(src_bytes, 'big')
+    dst_int = int.from_bytes(dst_bytes, 'big')
+    sport, dport = struct.unpack_from('!HH', buf, ip_end)
+    return (family, src_bytes, dst_bytes, src_int, dst_int,
+            sport, dport, ip_end)
+
+try:
+    # cythonize -i common/_radar_fast.pyx 生成的编译版本
+    from common._radar_fast import parse as _parse
+except ImportError:
+    _parse = _parse_py
+
+class MultiRadar:
+    """单分类线程匹配全部 TCP 规则
+
+    以前每条规则一个 radar 线程、各自在环上注册读者，N 条规则意味着
+    每个包被拷出并匹配 N 次。现在只注册一个读者，头部解析一次，然后
+    在预计算好的整数掩码表上按族扫描规则；已拦截表也全局一份。
+    """
+
     def __init__(self, kwargs):
         self.buffer: ringbuffer.RingBuffer = kwargs['buffer']
-        self.src_net: ipaddress.ip_network = ipaddress.ip_network(kwargs['src'])
-        self.dst_net: ipaddress.ip_network = ipaddress.ip_network(kwargs['dst'])
+        # 网段的整数边界由 RuleSet 在加载时算好，按族分表
+        rules = kwargs['rules']
+        self.rules4 = tuple((r.src_v, r.src_m, r.dst_v, r.dst_m)
+                            for r in rules if r.family == 4)
+        self.rules6 = tuple((r.src_v, r.src_m, r.dst_v, r.dst_m)
+                            for r in rules if r.family == 6)
         self.iface = kwargs['iface']
         self.dst_mac = kwargs['dst_mac']
         self.reader = self.buffer.register()
         self.radar_thread = None
         self.stopFlag = False
-        # 新增：用于追踪已拦截的连接，防止重复操作
-        self.intercepted_conns = set()
-        self.conn_timestamps = {}  # 新增: 记录拦截时间
-
-    def get_tcp_info(self,packet):
-        # 结果字典，用于存储提取的信息
-        info = {
-            "version": None,
-            "src_addr": None,
-            "dst_addr": None,
-            "tcp_details": {}
-        }
-
-        # 1. 判断网络层 (IPv4 或 IPv6)
-        if packet.haslayer(IP):
-            info["version"] = "IPv4"
-            info["src_addr"] = packet[IP].src
-            info["dst_addr"] = packet[IP].dst
-        elif packet.haslayer(IPv6):
-            info["version"] = "IPv6"
-            info["src_addr"] = packet[IPv6].src
-            info["dst_addr"] = packet[IPv6].dst
-        else:
-            return None  # 非 IP 报文，直接跳过
-
-        # 2. 判断传输层是否为 TCP
-        if packet.haslayer(TCP):
-            tcp = packet[TCP]
-            info["tcp_details"] = {
-                "sport": tcp.sport,
-                "dport": tcp.dport,
-                "seq": tcp.seq,
-                "ack": tcp.ack,
-                "flags": tcp.underlayer.sprintf("%TCP.flags%"), # 易读格式化标志位
-                "window": tcp.window
-            }
-            
-            return info
-    
-    def _cleanup_old_connections(self, timeout=300):
-        """清理5分钟前的连接记录"""
-        current_time = time.time()
-        old_conns = [conn for conn, ts in self.conn_timestamps.items() 
-                    if current_time - ts > timeout]
-        for conn in old_conns:
-            self.intercepted_conns.discard(conn)
-            del self.conn_timestamps[conn]
+        # 已拦截连接表：四元组指纹 -> 拦截时间，按插入序的有界 LRU，
+        # 比存完整四元组的 set + dict 省内存，过期是 O(1) popitem
+        self.intercepted = OrderedDict()
+        self.intercepted_cap = 65536
+        self.conn_timeout = 300
+
+    def _expire_intercepted(self):
+        """从队头弹出超过5分钟的连接记录"""
+        deadline = time.time() - self.conn_timeout
+        intercepted = self.intercepted
+        while intercepted:
+            _, ts = next(iter(intercepted.items()))
+            if ts > deadline:
+                break
+            intercepted.popitem(last=False)
 
     def detection(self):
+        loop_count = 0
+        # 自适应退避：100µs 起步，连续空读时翻倍，上限 1ms，命中即复位
+        idle_sleep = 0.0001
         while not self.stopFlag:
-            # 定期清理旧连接记录 (每1000次循环清理一次)
-            if hasattr(self, 'loop_count'):
-                self.loop_count += 1
-                if self.loop_count % 1000 == 0:
-                    self._cleanup_old_connections()
-            else:
-                self.loop_count = 0
+            # 定期清理旧连接记录 (每1000批清理一次)
+            loop_count += 1
+            if loop_count % 1000 == 0:
+                self._expire_intercepted()
             try:
-                pkt_list = self.buffer.read(self.reader, max_items=1)
+                # 批量读取，锁/调度开销按批摊薄而不是按包支付
+                pkt_list = self.buffer.read(self.reader, max_items=128)
                 if not pkt_list:
-                    time.sleep(0.001)  # 避免空转
-                    continue
-            
-                pkt = pkt_list[0]
-                if not pkt.haslayer(TCP):
+                    time.sleep(idle_sleep)
+                    idle_sleep = min(idle_sleep * 2, 0.001)
                     continue
+                idle_sleep = 0.0001
 
-                pkt_info = self.get_tcp_info(pkt)
-                if not pkt_info:
-                    continue
+                for buf in pkt_list:
+                    res = _parse(buf)
+                    if res is None:
+                        continue
+                    family, src_bytes, dst_bytes, src_int, dst_int, \
+                        sport, dport, ip_end = res
+
+                    # 按族线性扫描掩码表，规则数量级下比前缀树更划算
+                    rules = self.rules4 if family == 4 else self.rules6
+                    for src_v, src_m, dst_v, dst_m in rules:
+                        if (src_int & src_m) == src_v and \
+                                (dst_int & dst_m) == dst_v:
+                            break
+                    else:
+                        continue  # 没有命中任何规则
+
+                    # 连接四元组压成 32 位指纹作为 Key
+                    fp = hash((src_int, sport, dst_int, dport)) & 0xFFFFFFFF
+
+                    if fp in self.intercepted:
+                        continue  # 已经拦截过了，不再处理
+
+                    # --- 连接追踪逻辑 ---
+                    # 1. 如果是 SYN (S)，说明刚开始握手，记录但不拦截
+                    # 2. 我们选择在看到第一个 ACK (A) 且不是 SYN-ACK 时，
+                    #    或者在有数据传输 (PA) 时进行拦截，这确保了握手基本完成。
+                    # SYN 位直接在 TCP 头第 13 字节上做位与，一条指令
+                    if buf[ip_end + 13] & 0x02:
+                        continue  # 跳过握手前两个阶段
+
+                    # seq/ack 同样直接从头部取，scapy 彻底退出热路径
+                    seq, ack = struct.unpack_from('!II', buf, ip_end + 4)
+
+                    # 命中后才把地址转回可读形式（冷路径，仅为日志）
+                    # %-参数延迟格式化，日志级别关掉时零开销
+                    log.info("Triggered src=%s:%d dst=%s:%d",
+                             _addr_str(src_bytes), sport,
+                             _addr_str(dst_bytes), dport)
+
+                    # 交给常驻发送线程执行拦截，radar 线程不阻塞
+                    interceptor.enqueue_rst(src_bytes, dst_bytes,
+                                            sport, dport, seq, ack,
+                                            self.dst_mac, self.iface)
 
-                # 提取连接四元组作为 Key
-                conn_key = (
-                    pkt_info['src_addr'], pkt_info['tcp_details']['sport'],
-                    pkt_info['dst_addr'], pkt_info['tcp_details']['dport']
-                )
-
-                # 提取标志位
-                flags = pkt[TCP].flags
-                
-                # --- 连接追踪逻辑 ---
-                # 1. 如果是 SYN (S)，说明刚开始握手，记录但不拦截
-                # 2. 我们选择在看到第一个 ACK (A) 且不是 SYN-ACK 时，
-                #    或者在有数据传输 (PA) 时进行拦截，这确保了握手基本完成。
-                
-                if "S" in flags:
-                    continue  # 跳过握手前两个阶段
-
-                if conn_key in self.intercepted_conns:
-                    continue  # 已经拦截过了，不再处理
-
-                src_addr = ipaddress.ip_address(pkt_info['src_addr'])
-                dst_addr = ipaddress.ip_address(pkt_info['dst_addr'])
-
-                if src_addr in self.src_net and dst_addr in self.dst_net:
-                    print(f"[Triggered] {pkt.summary()}")
-                    
-                    # 执行拦截
-                    interception = interceptor.TCPInterceptor({
-                        'src_addr': src_addr,
-                        'dst_addr': dst_addr,
-                        'src_port': pkt_info['tcp_details']['sport'],
-                        'dst_port': pkt_info['tcp_details']['dport'],
-                        'seq': pkt_info['tcp_details']['seq'],
-                        'ack': pkt_info['tcp_details']['ack'],
-                        'dst_mac': self.dst_mac,
-                        'iface': self.iface
-                    })
-                    interception.intercept()
-                    
-                    # 标记该连接已处理
-                    self.intercepted_conns.add(conn_key)
+                    # 标记该连接已处理，超出容量时淘汰最老的记录
+                    self.intercepted[fp] = time.time()
+                    if len(self.intercepted) > self.intercepted_cap:
+                        self.intercepted.popitem(last=False)
 
             except Exception as e:
-                print(f"Error in detection: {e}")
+                log.error("Error in detection: %s", e)
                 time.sleep(0.001)
                 continue
 
@@ -137,9 +180,9 @@ class TCPRadar:
         self.stopFlag = False
         self.radar_thread = threading.Thread(target=self.detection, daemon=True)
         self.radar_thread.start()
-        print('TCP radar stared')
+        log.info('TCP radar started')
 
     def stop(self):
         self.stopFlag = True
         self.radar_thread.join(5)
-        print('TCP radar stopped')
+        log.info('TCP radar stopped')
@@ -0,0 +1,207 @@
+from typing import Dict, List, Optional
+import time
+
+from common.ringbuffer import RingBuffer, STAT_TOTAL_READS
+
+class RingBufferDebugMixin:
+    """RingBuffer 的调试/运维扩展
+
+    这些方法每项都按包分配 dict，且生产代码里没有调用方。
+    放在生产类之外，既缩小热模块体积，也避免被误用到热路径上。
+    """
+
+    def read_with_metadata(self, reader_id: int, max_items: int = 1) -> List[Dict]:
+        """
+        读取数据并包含元数据（版本号、时间戳等）
+
+        Args:
+            reader_id: 读者ID
+            max_items: 最多读取多少项数据
+
+        Returns:
+            包含数据和元数据的字典列表
+        """
+        reader = self.readers.get(reader_id)
+        if reader is None:
+            raise ValueError(f"Reader {reader_id} not registered")
+
+        wv = self.write_version
+        lv = reader.last_version
+        mask = self.idx_mask
+
+        items_to_read = []
+
+        for _ in range(max_items):
+            nxt = lv + 1
+            if nxt >= wv:
+                break
+
+            idx = nxt & mask
+            v = self.versions[idx]
+            if v < nxt:
+                break
+            if v > nxt:
+                reader.gaps += v - nxt
+            items_to_read.append({
+                'data': self.payloads[idx],
+                'version': v,
+                'timestamp': self.timestamps[v & mask]
+                             if self.track_timestamps else None,
+                'reader_name': reader.name
+            })
+            lv = v
+
+        if items_to_read:
+            reader.last_version = lv
+            reader.read_count += len(items_to_read)
+            reader.last_read_time = time.time()
+            self.stats_arr[STAT_TOTAL_READS] += len(items_to_read)
+
+        return items_to_read
+
+    def get_reader_info(self, reader_id: Optional[int] = None) -> Dict:
+        """
+        获取读者信息
+
+        Args:
+            reader_id: 读者ID，如果为None则返回所有读者信息
+
+        Returns:
+            读者信息字典
+        """
+        def as_dict(reader):
+            return {slot: getattr(reader, slot) for slot in reader.__slots__}
+
+        with self.reader_lock:
+            if reader_id is not None:
+                if reader_id in self.readers:
+                    return as_dict(self.readers[reader_id])
+                else:
+                    raise ValueError(f"Reader {reader_id} not registered")
+            else:
+                return {rid: as_dict(r) for rid, r in self.readers.items()}
+
+    def get_pending_data_for_reader(self, reader_id: int) -> List[Dict]:
+        """
+        获取指定读者待读取的数据（不实际读取）
+
+        Args:
+            reader_id: 读者ID
+
+        Returns:
+            待读取的数据信息
+        """
+        reader = self.readers.get(reader_id)
+        if reader is None:
+            raise ValueError(f"Reader {reader_id} not registered")
+
+        wv = self.write_version
+        nxt = reader.last_version + 1
+
+        pending_data = []
+
+        while nxt < wv:
+            idx = nxt & self.idx_mask
+            v = self.versions[idx]
+            if v < nxt:
+                break
+
+            pending_data.append({
+                'data': self.payloads[idx],
+                'version': v,
+                'timestamp': self.timestamps[v & self.idx_mask]
+                             if self.track_timestamps else None,
+                'buffer_position': v & self.idx_mask
+            })
+            nxt = v + 1
+
+        return pending_data
+
+    def cleanup_old_readers(self, timeout_seconds: float = 3600) -> int:
+        """
+        清理长时间未活动的读者
+
+        Args:
+            timeout_seconds: 超时时间（秒）
+
+        Returns:
+            清理的读者数量
+        """
+        with self.reader_lock:
+            current_time = time.time()
+            readers_to_remove = []
+
+            for reader_id, reader in self.readers.items():
+                last_read = reader.last_read_time
+                if last_read is not None:
+                    if current_time - last_read > timeout_seconds:
+                        readers_to_remove.append(reader_id)
+                else:
+                    # 从未读取过的读者，检查注册时间
+                    if current_time - reader.registered_time > timeout_seconds:
+                        readers_to_remove.append(reader_id)
+
+            for reader_id in readers_to_remove:
+                del self.readers[reader_id]
+
+            return len(readers_to_remove)
+
+class DebugRingBuffer(RingBufferDebugMixin, RingBuffer):
+    """带完整调试 API 的环形缓冲区"""
+
+# 使用示例
+def usage_example():
+    """使用示例"""
+    # 创建环形缓冲区
+    buffer = DebugRingBuffer(size=5)
+
+    # 注册两个读者
+    reader1 = buffer.register("consumer_1")
+    reader2 = buffer.register("consumer_2")
+
+    print(f"Reader 1 ID: {reader1}")
+    print(f"Reader 2 ID: {reader2}")
+
+    # 写入一些数据
+    for i in range(10):
+        version = buffer.write(f"Message {i}")
+        print(f"Wrote message {i}, version: {version}")
+
+    # 读者1读取数据
+    print("\nReader 1 reading:")
+    data1 = buffer.read(reader1, max_items=3)
+    for item in data1:
+        print(f"  Got: {item}")
+
+    # 读者2读取数据
+    print("\nReader 2 reading:")
+    data2 = buffer.read(reader2, max_items=5)
+    for item in data2:
+        print(f"  Got: {item}")
+
+    # 读者1再次读取
+    print("\nReader 1 reading again:")
+    data1 = buffer.read(reader1, max_items=5)
+    for item in data1:
+        print(f"  Got: {item}")
+
+    # 获取状态信息
+    print("\nBuffer status:")
+    status = buffer.get_buffer_status()
+    for key, value in status.items():
+        if key == 'stats':
+            print(f"  {key}:")
+            for k, v in value.items():
+                print(f"    {k}: {v}")
+        else:
+            print(f"  {key}: {value}")
+
+    # 获取待读取数据
+    print("\nPending data for reader 2:")
+    pending = buffer.get_pending_data_for_reader(reader2)
+    for item in pending:
+        print(f"  Version {item['version']}: {item['data']}")
+
+
+if __name__ == "__main__":
+    usage_example()
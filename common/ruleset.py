@@ -1,14 +1,29 @@
 from common import load
+import ipaddress
 
 class Rule:
     src:str
     dst:str
     proto:str
+    family:int
+    src_v:int
+    src_m:int
+    dst_v:int
+    dst_m:int
 
     def __init__(self,rule:dict):
         self.src = rule['source']
         self.dst = rule['destination']
         self.proto = rule['proto']
+        # 网段的整数形式在加载时算好，热路径上只做位与比较，
+        # 不再经过 ipaddress 的网络对象
+        src_net = ipaddress.ip_network(self.src)
+        dst_net = ipaddress.ip_network(self.dst)
+        self.family = src_net.version
+        self.src_v = int(src_net.network_address)
+        self.src_m = int(src_net.netmask)
+        self.dst_v = int(dst_net.network_address)
+        self.dst_m = int(dst_net.netmask)
 
 class RuleSet:
     raw_config:dict
@@ -16,4 +31,4 @@ class RuleSet:
 
     def __init__(self,path:str):
         self.raw_config = load.load(path)
-        self.rule_set = tuple(Rule(i) for i in self.raw_config['ruleset'])
\ No newline at end of file
+        self.rule_set = tuple(Rule(i) for i in self.raw_config['ruleset'])
@@ -1,7 +1,9 @@
+from common import bpf
 from common import config
 from common import ruleset
 from common import packet_capture
 from common import radar
+from common import interceptor
 import time
 
 configuration = config.Config('config.json')
@@ -9,12 +11,13 @@ rule_set = ruleset.RuleSet('ruleset.json').rule_set
 radars = []
 
 if __name__ == '__main__':
-    capture = packet_capture.PacketCapture({'sniff_if':configuration.sniff_if})
+    interceptor.init_tx_socket(configuration.egress_if)
+    interceptor.start_sender()
+    tcp_rules = [rule for rule in rule_set if rule.proto == 'tcp']
+    capture = packet_capture.PacketCapture({'sniff_if':configuration.sniff_if,'filter':bpf.rule_filter_expr(tcp_rules)})
     capture.run()
-    for rule in rule_set:
-        if rule.proto == 'tcp':
-            radars.append(radar.TCPRadar({'buffer':capture.pkt_buffer,'src':rule.src,'dst':rule.dst,'iface':configuration.egress_if,'dst_mac':configuration.dst_mac}))
-            radars[-1].run()
+    radars.append(radar.MultiRadar({'buffer':capture.pkt_buffer,'rules':tcp_rules,'iface':configuration.egress_if,'dst_mac':configuration.dst_mac}))
+    radars[-1].run()
     try:
         while True:
             time.sleep(1)